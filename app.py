@@ -2,8 +2,13 @@
 
 import os
 import sqlite3
+import tempfile
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import altair as alt
 import matplotlib.pyplot as plt
 import streamlit as st
 from dotenv import load_dotenv
@@ -21,32 +26,244 @@ if DB_URL.startswith("sqlite:///"):
 else:
     db_path = DB_URL
 
-@st.cache_data
+# Columnar snapshot of the joined fact+dim query, kept next to the database so
+# the ETL (which deletes it after every insert) resolves the same file
+# regardless of either process's working directory
+_cache_path = os.path.join(
+    os.path.dirname(os.path.abspath(db_path)), "weather_cache.parquet"
+)
+
+WEATHER_SQL = """
+    SELECT
+        fw.obs_ts,
+        fw.temp_c,
+        fw.feels_like_c,
+        fw.humidity_pct,
+        fw.pressure_hpa,
+        fw.wind_speed_ms,
+        fw.clouds_pct,
+        dl.city_name,
+        dw.weather_main,
+        dw.weather_desc
+    FROM fact_weather AS fw
+    JOIN dim_location AS dl
+      ON fw.location_id = dl.location_id
+    JOIN dim_weather AS dw
+      ON fw.weather_id = dw.weather_id
+"""
+
+NUMERIC_COLS = [
+    "temp_c",
+    "feels_like_c",
+    "humidity_pct",
+    "pressure_hpa",
+    "wind_speed_ms",
+    "clouds_pct",
+]
+
+CAT_COLS = ["city_name", "weather_main", "weather_desc"]
+
+CITY_COLORS = {"Bengaluru": "blue", "London": "green", "New York": "red"}
+
+@st.cache_resource
+def get_conn():
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # Read path tuning: memory-map up to 256 MB of the file, keep a 64 MB page
+    # cache and in-memory temp tables; the dashboard never writes to the DB
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA query_only=1")
+    return conn
+
+def _data_version():
+    # Fingerprint of fact_weather's contents. File mtimes can't be trusted here:
+    # in WAL mode commits land in weather.db-wal and leave weather.db untouched
+    count, max_id = get_conn().execute(
+        "SELECT COUNT(*), MAX(id) FROM fact_weather"
+    ).fetchone()
+    return f"{count}:{max_id}".encode()
+
+@st.cache_data(ttl=600)
 def load_data():
-    conn = sqlite3.connect(db_path)
+    # Taken before the query: if the ETL commits in between, the snapshot is
+    # tagged with the older version and simply gets rebuilt on the next load
+    version = _data_version()
+
+    # Serve the parquet snapshot only if it was built from this same version.
+    # Opened once and checked on the same object: the ETL may delete the file
+    # at any moment, and a missing or unreadable snapshot is just a cache miss
+    try:
+        snapshot = pq.read_table(_cache_path)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        snapshot = None
+    if (
+        snapshot is not None
+        and (snapshot.schema.metadata or {}).get(b"data_version") == version
+    ):
+        return snapshot.to_pandas().set_index("obs_ts")
+
+    # Typed at read time: obs_ts → datetime (UTC-aware), float32 measurements
+    # and categorical labels (half the bytes per value, integer group keys)
+    df = pd.read_sql_query(
+        WEATHER_SQL,
+        get_conn(),
+        dtype={
+            **{col: "float32" for col in NUMERIC_COLS},
+            **{col: "category" for col in CAT_COLS},
+        },
+        # Stored as a mix of "+00:00"-suffixed and naive ISO strings;
+        # ISO8601 parses both (naive rows are taken as UTC) instead of
+        # coercing the odd ones out to NaT
+        parse_dates={"obs_ts": {"utc": True, "format": "ISO8601"}},
+    )
+    # Sorted by time so date-range filters can binary-search the index
+    df = df.sort_values("obs_ts", ignore_index=True)
+    try:
+        _write_snapshot(df, version)
+    except OSError:
+        # The snapshot is only a cache: if it can't be written (e.g. the data
+        # directory is read-only) keep serving straight from SQLite
+        pass
+    return df.set_index("obs_ts")
+
+def _write_snapshot(df, version):
+    # Write to a temp file in the same directory and rename it into place, so
+    # a concurrent session never reads a half-written snapshot
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(_cache_path), prefix="weather_cache.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, b"data_version": version}
+        )
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, _cache_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _date_bounds(start_date, end_date):
+    # Convert start_date and end_date (Python date) to UTC-aware Timestamps
+    start_ts = pd.to_datetime(start_date).tz_localize("UTC")
+    end_ts = pd.to_datetime(end_date).tz_localize("UTC")
+    return start_ts, end_ts
+
+def _filter_clause(cities, start_ts, end_ts):
+    """
+    Build the WHERE clause + bound parameters for a city/date selection
+    against fact_weather_hourly (aliased fwh) joined to dim_location (dl).
+    An empty city selection means "all cities", matching the sidebar default.
+    The range is half-open, [start, end), like load_filtered(): hour buckets
+    start on the hour, so this selects exactly the raw rows it keeps.
+    """
+    clauses, params = [], []
+    if cities:
+        clauses.append(f"dl.city_name IN ({', '.join('?' * len(cities))})")
+        params.extend(cities)
+    clauses.append("fwh.hour_bucket >= ? AND fwh.hour_bucket < ?")
+    params.extend([str(start_ts), str(end_ts)])
+    return " WHERE " + " AND ".join(clauses), params
+
+@st.cache_data(ttl=600)
+def load_cities():
+    # Only cities that actually have observations
     df = pd.read_sql(
         """
-        SELECT
-            fw.obs_ts,
-            fw.temp_c,
-            fw.feels_like_c,
-            fw.humidity_pct,
-            fw.pressure_hpa,
-            fw.wind_speed_ms,
-            fw.clouds_pct,
-            dl.city_name,
-            fw.weather_main,
-            fw.weather_desc
-        FROM fact_weather AS fw
-        JOIN dim_location AS dl
-          ON fw.location_id = dl.location_id
+        SELECT city_name
+        FROM dim_location
+        WHERE location_id IN (SELECT DISTINCT location_id FROM fact_weather)
+        ORDER BY location_id
         """,
-        conn,
+        get_conn(),
     )
-    conn.close()
-    # Convert obs_ts → datetime (UTC-aware) and set as index
-    df["obs_ts"] = pd.to_datetime(df["obs_ts"], utc=True, errors="coerce")
-    return df.set_index("obs_ts")
+    return df["city_name"].tolist()
+
+@st.cache_data(ttl=600)
+def load_filtered(cities, start_date, end_date):
+    df = load_data()
+    if cities:
+        # Match on the int8 category codes rather than hashing city strings
+        city_codes = df["city_name"].cat.categories.get_indexer(cities)
+        codes = df["city_name"].cat.codes.to_numpy()
+        df = df.take(np.flatnonzero(np.isin(codes, city_codes[city_codes >= 0])))
+    start_ts, end_ts = _date_bounds(start_date, end_date)
+    if df.index.is_monotonic_increasing:
+        lo = df.index.searchsorted(start_ts, side="left")
+        hi = df.index.searchsorted(end_ts, side="left")
+        df = df.iloc[lo:hi].copy()
+    else:
+        df = df.loc[(df.index >= start_ts) & (df.index < end_ts)].copy()
+    # Drop labels absent from the selection so charts don't draw empty groups
+    for col in CAT_COLS:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+@st.cache_data(ttl=600)
+def load_stats(cities, start_date, end_date):
+    """
+    Per-city mean / min / max / std of every numeric column, rolled up from
+    the ETL's fact_weather_hourly summary (one row per city per hour), so the
+    date filter applies at hour granularity.
+    SQLite has no STDEV, so std is derived from SUM and SUM of squares.
+    """
+    aggs = ["SUM(fwh.n_obs) AS n_obs"]
+    for col in NUMERIC_COLS:
+        aggs += [
+            f"SUM(fwh.{col}_sum) AS {col}_sum",
+            f"SUM(fwh.{col}_sumsq) AS {col}_sumsq",
+            f"MIN(fwh.{col}_min) AS {col}_min",
+            f"MAX(fwh.{col}_max) AS {col}_max",
+        ]
+    where, params = _filter_clause(cities, *_date_bounds(start_date, end_date))
+    df = pd.read_sql(
+        "SELECT dl.city_name, " + ", ".join(aggs)
+        + " FROM fact_weather_hourly AS fwh"
+        + " JOIN dim_location AS dl ON fwh.location_id = dl.location_id"
+        + where
+        + " GROUP BY dl.city_name ORDER BY dl.city_name",
+        get_conn(),
+        params=params,
+        index_col="city_name",
+    )
+    n = df["n_obs"]
+    stats = pd.DataFrame({"n_obs": n}, index=df.index)
+    for col in NUMERIC_COLS:
+        var = (df[f"{col}_sumsq"] - df[f"{col}_sum"] ** 2 / n) / (n - 1)
+        stats[f"{col}_mean"] = df[f"{col}_sum"] / n
+        stats[f"{col}_min"] = df[f"{col}_min"]
+        stats[f"{col}_max"] = df[f"{col}_max"]
+        stats[f"{col}_std"] = var.clip(lower=0) ** 0.5
+    return stats
+
+@st.cache_data(ttl=600)
+def hourly_by_city(cities, start_date, end_date):
+    # Hourly mean temperature read straight from fact_weather_hourly;
+    # columns are cities, rows are hourly bins
+    where, params = _filter_clause(cities, *_date_bounds(start_date, end_date))
+    df = pd.read_sql(
+        "SELECT fwh.hour_bucket AS obs_ts, dl.city_name,"
+        + " fwh.temp_c_sum / fwh.n_obs AS temp_c"
+        + " FROM fact_weather_hourly AS fwh"
+        + " JOIN dim_location AS dl ON fwh.location_id = dl.location_id"
+        + where,
+        get_conn(),
+        params=params,
+        parse_dates={"obs_ts": {"utc": True}},
+    )
+    return df.pivot(index="obs_ts", columns="city_name", values="temp_c").sort_index()
+
+@st.cache_data(ttl=600)
+def count_codes(codes_bytes, dtype, n_categories):
+    # Category frequencies as an integer bincount over the raw codes buffer;
+    # the bytes double as a cheap cache key
+    codes = np.frombuffer(codes_bytes, dtype=dtype)
+    return np.bincount(codes[codes >= 0], minlength=n_categories)
 
 df_weather = load_data()
 
@@ -58,7 +275,7 @@ st.sidebar.title("Filters & Options")
 st.sidebar.markdown("Use the controls below to customize the dashboard view.")
 
 # City filter
-cities = df_weather["city_name"].unique().tolist()
+cities = load_cities()
 selected_cities = st.sidebar.multiselect(
     "Select City (all by default)",
     options=cities,
@@ -86,20 +303,7 @@ section_viz = st.sidebar.checkbox("Show Visualizations", value=False)
 # 3. Filter data based on selections
 # ──────────────────────────────────────────────────────────────────────────────
 
-# Filter by city
-if selected_cities:
-    df_filtered = df_weather[df_weather["city_name"].isin(selected_cities)]
-else:
-    df_filtered = df_weather.copy()
-
-# Convert start_date and end_date (Python date) to UTC-aware Timestamps
-start_ts = pd.to_datetime(start_date).tz_localize("UTC")
-end_ts = pd.to_datetime(end_date).tz_localize("UTC")
-
-# Now filter by timestamp range
-df_filtered = df_filtered.loc[
-    (df_filtered.index >= start_ts) & (df_filtered.index <= end_ts)
-]
+df_filtered = load_filtered(tuple(selected_cities), start_date, end_date)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 4. Page Title and Key Metrics
@@ -141,24 +345,18 @@ if section_stats:
     if df_filtered.empty:
         st.info("No data available for the selected filters.")
     else:
-        stats_by_city = (
-            df_filtered.groupby("city_name")
-            .agg(
-                {
-                    "temp_c": ["mean", "min", "max", "std"],
-                    "feels_like_c": ["mean", "min", "max", "std"],
-                    "humidity_pct": ["mean", "min", "max", "std"],
-                    "pressure_hpa": ["mean", "min", "max", "std"],
-                    "wind_speed_ms": ["mean", "min", "max", "std"],
-                    "clouds_pct": ["mean", "min", "max", "std"],
-                }
+        stats_by_city = load_stats(tuple(selected_cities), start_date, end_date)
+        # The table comes from fact_weather_hourly, everything else on the page
+        # from the raw rows; flag it if the two ever cover different data
+        if stats_by_city["n_obs"].sum() != len(df_filtered):
+            st.warning(
+                "The hourly summary doesn't match the raw observations for "
+                "this selection; the statistics below may be out of date."
             )
-        )
-        stats_by_city.columns = [
-            "_".join(col).strip() for col in stats_by_city.columns.values
-        ]
         with st.expander("Show Statistics Table"):
-            st.dataframe(stats_by_city.style.format("{:.2f}"))
+            st.dataframe(
+                stats_by_city.style.format("{:.2f}").format("{:d}", subset=["n_obs"])
+            )
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 6. Correlation Section
@@ -169,15 +367,16 @@ if section_corr:
     if df_filtered.empty:
         st.info("No data available for the selected filters.")
     else:
-        numeric_cols = [
-            "temp_c",
-            "feels_like_c",
-            "humidity_pct",
-            "pressure_hpa",
-            "wind_speed_ms",
-            "clouds_pct",
-        ]
-        corr_matrix = df_filtered[numeric_cols].corr()
+        numeric_cols = NUMERIC_COLS
+        # np.corrcoef is a single covariance pass over a dense float64 block,
+        # so drop incomplete rows up front instead of pandas' pairwise masks
+        arr = df_filtered[numeric_cols].to_numpy(dtype=np.float64)
+        arr = arr[~np.isnan(arr).any(axis=1)]
+        # Zero-variance columns (constant back-dated snapshots) come out as
+        # NaN, same as DataFrame.corr(), without a divide warning every rerun
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.corrcoef(arr, rowvar=False)
+        corr_matrix = pd.DataFrame(corr, index=numeric_cols, columns=numeric_cols)
         fig, ax = plt.subplots(figsize=(6, 5))
         cax = ax.matshow(corr_matrix, cmap="coolwarm")
         fig.colorbar(cax)
@@ -196,28 +395,58 @@ if section_viz:
 
     tabs = st.tabs(["Histogram", "Boxplot", "Time Series", "Scatterplot", "Pie Chart"])
 
+    # Tabs 1-4 are Vega-Lite charts rendered in the browser; only the columns
+    # each chart encodes are shipped, and per-city colouring is an encoding
+    # rather than a Python loop
+    points = df_filtered[["city_name", "temp_c", "humidity_pct"]].reset_index(drop=True)
+    # Fixed colour per city (gray for any other), resolved once per category
+    # rather than per row or per plotted subset
+    city_names = df_filtered["city_name"].cat.categories.tolist()
+    city_color = alt.Color(
+        "city_name:N",
+        title="City",
+        scale=alt.Scale(
+            domain=city_names,
+            range=[CITY_COLORS.get(city, "gray") for city in city_names],
+        ),
+    )
+
     # --- Tab 1: Histograms ---
     with tabs[0]:
         st.subheader("Histograms of Numeric Features")
         if df_filtered.empty:
             st.info("No data available for the selected filters.")
         else:
-            numeric_cols = [
-                "temp_c",
-                "feels_like_c",
-                "humidity_pct",
-                "pressure_hpa",
-                "wind_speed_ms",
-                "clouds_pct",
-            ]
-            cols = st.columns(3)
-            for i, col in enumerate(numeric_cols):
-                fig, ax = plt.subplots()
-                df_filtered[col].hist(bins=15, ax=ax)
-                ax.set_title(f"{col}")
-                ax.set_xlabel(col)
-                ax.set_ylabel("Frequency")
-                cols[i % 3].pyplot(fig)
+            # Bin counts come from np.histogram over the float32 block, so the
+            # chart only receives 15 rows per feature
+            arr = df_filtered[NUMERIC_COLS].to_numpy(dtype=np.float32)
+            hist_parts = []
+            for i, col in enumerate(NUMERIC_COLS):
+                values = arr[:, i]
+                counts, edges = np.histogram(values[~np.isnan(values)], bins=15)
+                hist_parts.append(
+                    pd.DataFrame(
+                        {
+                            "feature": col,
+                            "bin_start": edges[:-1],
+                            "bin_end": edges[1:],
+                            "count": counts,
+                        }
+                    )
+                )
+            hist_chart = (
+                alt.Chart(pd.concat(hist_parts, ignore_index=True))
+                .mark_bar()
+                .encode(
+                    x=alt.X("bin_start:Q", bin="binned", title=None),
+                    x2="bin_end:Q",
+                    y=alt.Y("count:Q", title="Frequency"),
+                )
+                .properties(width=200, height=150)
+                .facet(facet=alt.Facet("feature:N", sort=NUMERIC_COLS, title=None), columns=3)
+                .resolve_scale(x="independent", y="independent")
+            )
+            st.altair_chart(hist_chart)
 
     # --- Tab 2: Boxplots ---
     with tabs[1]:
@@ -225,21 +454,25 @@ if section_viz:
         if df_filtered.empty:
             st.info("No data available for the selected filters.")
         else:
-            fig1, ax1 = plt.subplots(figsize=(8, 4))
-            df_filtered.boxplot(column="temp_c", by="city_name", ax=ax1)
-            ax1.set_title("Temperature by City")
-            ax1.set_xlabel("City")
-            ax1.set_ylabel("Temperature (°C)")
-            plt.suptitle("")
-            st.pyplot(fig1)
-
-            fig2, ax2 = plt.subplots(figsize=(8, 4))
-            df_filtered.boxplot(column="humidity_pct", by="city_name", ax=ax2)
-            ax2.set_title("Humidity by City")
-            ax2.set_xlabel("City")
-            ax2.set_ylabel("Humidity (%)")
-            plt.suptitle("")
-            st.pyplot(fig2)
+            box_temp = (
+                alt.Chart(points, title="Temperature by City")
+                .mark_boxplot()
+                .encode(
+                    x=alt.X("city_name:N", title="City"),
+                    y=alt.Y("temp_c:Q", title="Temperature (°C)"),
+                )
+            )
+            st.altair_chart(box_temp)
+
+            box_humidity = (
+                alt.Chart(points, title="Humidity by City")
+                .mark_boxplot()
+                .encode(
+                    x=alt.X("city_name:N", title="City"),
+                    y=alt.Y("humidity_pct:Q", title="Humidity (%)"),
+                )
+            )
+            st.altair_chart(box_humidity)
 
     # --- Tab 3: Time Series ---
     with tabs[2]:
@@ -247,16 +480,25 @@ if section_viz:
         if df_filtered.empty:
             st.info("No data available for the selected filters.")
         else:
-            fig_ts, ax_ts = plt.subplots(figsize=(8, 4))
-            for city, group in df_filtered.groupby("city_name"):
-                hourly_mean = group["temp_c"].resample("H").mean()
-                ax_ts.plot(hourly_mean.index.hour, hourly_mean.values, marker="o", label=city)
-            ax_ts.set_title("Hourly Temperature by City (UTC Hour)")
-            ax_ts.set_xlabel("Hour of Day (UTC)")
-            ax_ts.set_ylabel("Temperature (°C)")
-            ax_ts.set_xticks(range(0, 24))
-            ax_ts.legend()
-            st.pyplot(fig_ts)
+            hourly = hourly_by_city(tuple(selected_cities), start_date, end_date)
+            hourly_long = (
+                hourly.stack()
+                .rename("temp_c")
+                .reset_index()
+                .assign(hour=lambda d: d["obs_ts"].dt.hour)
+            )
+            ts_chart = (
+                alt.Chart(hourly_long, title="Hourly Temperature by City (UTC Hour)")
+                .mark_line(point=True)
+                .encode(
+                    x=alt.X("hour:Q", title="Hour of Day (UTC)", scale=alt.Scale(domain=[0, 23])),
+                    y=alt.Y("temp_c:Q", title="Temperature (°C)", scale=alt.Scale(zero=False)),
+                    color=city_color,
+                    # Draw each line in time order, as the hour axis wraps at midnight
+                    order="obs_ts:T",
+                )
+            )
+            st.altair_chart(ts_chart)
 
     # --- Tab 4: Scatterplot ---
     with tabs[3]:
@@ -264,22 +506,16 @@ if section_viz:
         if df_filtered.empty:
             st.info("No data available for the selected filters.")
         else:
-            fig_sc, ax_sc = plt.subplots(figsize=(6, 4))
-            colors = {"Bengaluru": "blue", "London": "green", "New York": "red"}
-            for city in df_filtered["city_name"].unique():
-                subset = df_filtered[df_filtered["city_name"] == city]
-                ax_sc.scatter(
-                    subset["temp_c"],
-                    subset["humidity_pct"],
-                    label=city,
-                    alpha=0.7,
-                    c=colors.get(city, "gray"),
+            scatter = (
+                alt.Chart(points, title="Temp vs. Humidity")
+                .mark_circle(opacity=0.7)
+                .encode(
+                    x=alt.X("temp_c:Q", title="Temperature (°C)", scale=alt.Scale(zero=False)),
+                    y=alt.Y("humidity_pct:Q", title="Humidity (%)", scale=alt.Scale(zero=False)),
+                    color=city_color,
                 )
-            ax_sc.set_title("Temp vs. Humidity")
-            ax_sc.set_xlabel("Temperature (°C)")
-            ax_sc.set_ylabel("Humidity (%)")
-            ax_sc.legend()
-            st.pyplot(fig_sc)
+            )
+            st.altair_chart(scatter)
 
     # --- Tab 5: Pie Chart ---
     with tabs[4]:
@@ -287,11 +523,22 @@ if section_viz:
         if df_filtered.empty:
             st.info("No data available for the selected filters.")
         else:
-            weather_counts = df_filtered["weather_main"].value_counts()
-            fig_pie, ax_pie = plt.subplots(figsize=(5, 5))
-            weather_counts.plot(
-                kind="pie", autopct="%1.1f%%", startangle=140, ax=ax_pie
+            weather_main = df_filtered["weather_main"]
+            codes = weather_main.cat.codes.to_numpy()
+            weather_counts = pd.Series(
+                count_codes(codes.tobytes(), codes.dtype.str, len(weather_main.cat.categories)),
+                index=weather_main.cat.categories,
+            ).sort_values(ascending=False)
+            weather_counts = weather_counts[weather_counts > 0]
+            pie_data = weather_counts.rename_axis("weather_main").reset_index(name="count")
+            pie_data["share"] = pie_data["count"] / pie_data["count"].sum()
+            pie_base = alt.Chart(pie_data).encode(
+                theta=alt.Theta("count:Q", stack=True),
+                color=alt.Color("weather_main:N", title="Weather", sort=pie_data["weather_main"].tolist()),
+                order=alt.Order("count:Q", sort="descending"),
             )
-            ax_pie.set_ylabel("")
-            ax_pie.set_title("Weather Categories")
-            st.pyplot(fig_pie)
+            pie = (
+                pie_base.mark_arc(outerRadius=120)
+                + pie_base.mark_text(radius=145).encode(text=alt.Text("share:Q", format=".1%"))
+            ).properties(title="Weather Categories")
+            st.altair_chart(pie)
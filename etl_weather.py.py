@@ -27,13 +27,16 @@ Usage:
 import os
 import time
 import smtplib
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import requests
 import schedule
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from sqlalchemy import (
     create_engine,
     MetaData,
@@ -44,6 +47,9 @@ from sqlalchemy import (
     Numeric,
     DateTime,
     ForeignKey,
+    Index,
+    UniqueConstraint,
+    event,
     text,
 )
 from dotenv import load_dotenv
@@ -103,6 +109,17 @@ def send_failure_alert(subject: str, body: str):
 engine = create_engine(DB_URL, echo=False)
 meta   = MetaData()
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _record):
+        # WAL (set in recreate_tables) only needs an fsync at checkpoints
+        # with synchronous=NORMAL, instead of one per committed transaction
+        dbapi_conn.execute("PRAGMA synchronous=NORMAL")
+        # Same page-cache / mmap sizing as the dashboard's read connection
+        dbapi_conn.execute("PRAGMA mmap_size=268435456")
+        dbapi_conn.execute("PRAGMA cache_size=-65536")
+        dbapi_conn.execute("PRAGMA temp_store=MEMORY")
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 4. Define table schemas
 # ──────────────────────────────────────────────────────────────────────────────
@@ -117,6 +134,17 @@ dim_location = Table(
     Column("lon",         Numeric,     nullable=False),
 )
 
+# Distinct (main, description) condition pairs, referenced by fact_weather
+# so each observation stores an integer instead of two repeated strings
+dim_weather = Table(
+    "dim_weather",
+    meta,
+    Column("weather_id",   Integer, primary_key=True, autoincrement=True),
+    Column("weather_main", String(50),  nullable=False),
+    Column("weather_desc", String(100), nullable=False),
+    UniqueConstraint("weather_main", "weather_desc"),
+)
+
 fact_weather = Table(
     "fact_weather",
     meta,
@@ -128,9 +156,32 @@ fact_weather = Table(
     Column("humidity_pct",  Numeric),
     Column("pressure_hpa",  Numeric),
     Column("wind_speed_ms", Numeric),
-    Column("weather_main",  String(50)),
-    Column("weather_desc",  String(100)),
+    Column("weather_id",    Integer, ForeignKey("dim_weather.weather_id")),
     Column("clouds_pct",    Numeric),
+    # Lets refresh_hourly_summary()'s obs_ts >= :since seek to the new batch;
+    # also covers the dashboard's DISTINCT location_id scan in load_cities()
+    Index("idx_fw_ts_loc", "obs_ts", "location_id"),
+)
+
+# Numeric fact columns pre-aggregated into fact_weather_hourly
+MEASURE_COLUMNS = [
+    "temp_c", "feels_like_c", "humidity_pct",
+    "pressure_hpa", "wind_speed_ms", "clouds_pct",
+]
+
+# One row per city per UTC hour. Sums / sums of squares (rather than averages)
+# let the dashboard roll hours up into exact means and standard deviations.
+fact_weather_hourly = Table(
+    "fact_weather_hourly",
+    meta,
+    Column("location_id", Integer, ForeignKey("dim_location.location_id"), primary_key=True),
+    Column("hour_bucket", DateTime(timezone=True), primary_key=True),
+    Column("n_obs",       Integer, nullable=False),
+    *[
+        Column(f"{col}_{agg}", Numeric)
+        for col in MEASURE_COLUMNS
+        for agg in ("sum", "sumsq", "min", "max")
+    ],
 )
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -140,12 +191,20 @@ fact_weather = Table(
 def recreate_tables():
     """
     Drop existing tables if they exist, then create them fresh.
-    WARNING: This deletes all data in dim_location and fact_weather.
+    WARNING: This deletes all data in dim_location, dim_weather, fact_weather
+    and fact_weather_hourly.
     """
     try:
         with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS fact_weather_hourly"))
             conn.execute(text("DROP TABLE IF EXISTS fact_weather"))
+            conn.execute(text("DROP TABLE IF EXISTS dim_weather"))
             conn.execute(text("DROP TABLE IF EXISTS dim_location"))
+        _weather_ids.clear()
+        if engine.dialect.name == "sqlite":
+            # journal_mode is persistent, so setting it once here is enough
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
         meta.create_all(engine)
         print("✅ Tables dropped (if they existed) and recreated.")
     except Exception as e:
@@ -193,7 +252,41 @@ def seed_locations():
 
 OWM_URL = "https://api.openweathermap.org/data/2.5/weather"
 
-def fetch_one_record(location_row: dict) -> dict:
+# Shared keep-alive session so concurrent fetches reuse pooled connections;
+# transient 429/5xx responses are retried with backoff instead of a fixed sleep
+MAX_FETCH_WORKERS = 8
+
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=MAX_FETCH_WORKERS,
+        pool_maxsize=MAX_FETCH_WORKERS,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+        ),
+    ),
+)
+
+# Parquet snapshot written by the Streamlit dashboard next to the SQLite file;
+# must be dropped after inserts
+_cache_path = os.path.join(
+    os.path.dirname(os.path.abspath(engine.url.database or "")),
+    "weather_cache.parquet",
+)
+
+def invalidate_dashboard_cache():
+    """
+    Remove the dashboard's parquet snapshot so its next load re-queries SQLite.
+    """
+    try:
+        os.remove(_cache_path)
+    except FileNotFoundError:
+        pass
+
+def fetch_one_record(location_row: dict, session: requests.Session = _session) -> dict:
     """
     Given a dict with keys (location_id, lat, lon),
     call /data/2.5/weather once and return a flattened dict including UNIX obs_ts.
@@ -204,7 +297,7 @@ def fetch_one_record(location_row: dict) -> dict:
         "units":"metric",
         "appid":API_KEY
     }
-    r = requests.get(OWM_URL, params=params, timeout=10)
+    r = session.get(OWM_URL, params=params, timeout=10)
     r.raise_for_status()
     data = r.json()
     return {
@@ -220,6 +313,89 @@ def fetch_one_record(location_row: dict) -> dict:
         "weather_desc":   data["weather"][0]["description"],
     }
 
+FACT_COLUMNS = [
+    "location_id", "obs_ts", "temp_c", "feels_like_c",
+    "humidity_pct", "pressure_hpa", "wind_speed_ms",
+    "weather_id", "clouds_pct"
+]
+
+# (weather_main, weather_desc) -> dim_weather.weather_id, filled as pairs are seen
+_weather_ids = {}
+
+def resolve_weather_ids(conn, pairs) -> dict:
+    """
+    Return {(main, desc): weather_id} for `pairs`, inserting any pair not yet
+    in dim_weather. Known pairs are served from the in-process cache.
+    """
+    ids = {pair: _weather_ids[pair] for pair in pairs if pair in _weather_ids}
+    for main, desc in set(pairs) - ids.keys():
+        conn.execute(
+            text("""
+                INSERT OR IGNORE INTO dim_weather (weather_main, weather_desc)
+                VALUES (:main, :desc)
+            """),
+            {"main": main, "desc": desc},
+        )
+        ids[(main, desc)] = conn.execute(
+            text("""
+                SELECT weather_id FROM dim_weather
+                WHERE weather_main = :main AND weather_desc = :desc
+            """),
+            {"main": main, "desc": desc},
+        ).scalar_one()
+    return ids
+
+def insert_fact_rows(df: pd.DataFrame) -> int:
+    """
+    Bulk-insert `df` into fact_weather with a single executemany in one
+    transaction, bypassing DataFrame.to_sql's per-row statement generation.
+    weather_main / weather_desc are replaced by their dim_weather weather_id.
+    obs_ts is stored as "YYYY-MM-DD HH:MM:SS+00:00" text, which
+    refresh_hourly_summary() compares against and buckets by hour.
+    """
+    pairs = list(zip(df["weather_main"], df["weather_desc"]))
+    insert_sql = (
+        f"INSERT INTO fact_weather ({', '.join(FACT_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(FACT_COLUMNS))})"
+    )
+    # Only the hour buckets touched by this batch need re-aggregating
+    since = str(pd.to_datetime(df["obs_ts"]).min().floor("h"))
+    with engine.begin() as conn:
+        ids = resolve_weather_ids(conn, pairs)
+        df = df.assign(weather_id=[ids[pair] for pair in pairs])
+        df = df[FACT_COLUMNS].astype({"obs_ts": str})
+        records = list(df.itertuples(index=False, name=None))
+        conn.exec_driver_sql(insert_sql, records)
+        refresh_hourly_summary(conn, since)
+    # Only cache ids once the transaction that may have created them commits
+    _weather_ids.update(ids)
+    return len(records)
+
+def refresh_hourly_summary(conn, since: str = ""):
+    """
+    Recompute fact_weather_hourly for every hour bucket at or after `since`
+    ("YYYY-MM-DD HH:00:00+00:00"); the default rebuilds the whole table.
+    Runs on the caller's connection so it commits together with the insert.
+    """
+    aggs = ", ".join(
+        f"SUM({col}), SUM({col} * {col}), MIN({col}), MAX({col})"
+        for col in MEASURE_COLUMNS
+    )
+    conn.execute(
+        text(f"""
+            INSERT OR REPLACE INTO fact_weather_hourly
+            SELECT
+                location_id,
+                strftime('%Y-%m-%d %H:00:00+00:00', obs_ts) AS hour_bucket,
+                COUNT(*),
+                {aggs}
+            FROM fact_weather
+            WHERE obs_ts >= :since
+            GROUP BY location_id, hour_bucket
+        """),
+        {"since": since},
+    )
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 8. Back-date helper: insert at least 25 hourly snapshots per city
 # ──────────────────────────────────────────────────────────────────────────────
@@ -232,46 +408,32 @@ def insert_backdated_snapshots(hours: int = 25):
     """
     try:
         # Load all city rows into a list of dicts
-        conn_sql = sqlite3.connect("weather.db")
-        df_locs = pd.read_sql("SELECT location_id, lat, lon FROM dim_location", conn_sql)
-        conn_sql.close()
+        df_locs = pd.read_sql("SELECT location_id, lat, lon FROM dim_location", engine)
 
         if df_locs.empty:
             print("⚠️ No cities found in dim_location; skipping back-date.")
             return
 
-        all_rows = []
-        for row in df_locs.itertuples(index=False):
-            loc_dict = {
-                "location_id": row.location_id,
-                "lat":          row.lat,
-                "lon":          row.lon
-            }
-            base = fetch_one_record(loc_dict)
-            # Generate `hours` snapshots: subtract 0..(hours-1) hours
-            for h in range(hours):
-                snapshot = base.copy()
-                snapshot["obs_ts"] = base["obs_ts"] - (h * 3600)
-                all_rows.append(snapshot)
-            time.sleep(1)  # throttle API calls
-
-        # Convert to DataFrame and transform obs_ts to UTC datetime
-        df_insert = pd.DataFrame(all_rows)
-        df_insert["obs_ts"] = pd.to_datetime(df_insert["obs_ts"], unit="s", utc=True)
+        # Fetch every city concurrently; the requests are I/O-bound
+        loc_dicts = df_locs.to_dict("records")
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as ex:
+            bases = list(ex.map(fetch_one_record, loc_dicts))
+
+        # Generate `hours` snapshots per city in one vectorised step:
+        # repeat each base row, then subtract 0..(hours-1) hours from obs_ts
+        df_bases = pd.DataFrame(bases)
+        df_insert = df_bases.loc[df_bases.index.repeat(hours)].reset_index(drop=True)
+        offsets = np.tile(np.arange(hours) * 3600, len(df_bases))
+        df_insert["obs_ts"] = df_insert["obs_ts"].to_numpy() - offsets
 
-        # Select columns in the correct order
-        df_to_write = df_insert[[
-            "location_id", "obs_ts", "temp_c", "feels_like_c",
-            "humidity_pct", "pressure_hpa", "wind_speed_ms",
-            "weather_main", "weather_desc", "clouds_pct"
-        ]]
+        # Transform obs_ts to UTC datetime
+        df_insert["obs_ts"] = pd.to_datetime(df_insert["obs_ts"], unit="s", utc=True)
 
         # Bulk-insert into fact_weather
-        conn_sql = sqlite3.connect("weather.db")
-        df_to_write.to_sql("fact_weather", conn_sql, if_exists="append", index=False)
-        conn_sql.close()
+        n_rows = insert_fact_rows(df_insert)
+        invalidate_dashboard_cache()
 
-        print(f"✅ Inserted {len(df_to_write)} back-dated rows "
+        print(f"✅ Inserted {n_rows} back-dated rows "
               f"({hours} hourly snapshots per city).")
     except Exception as e:
         subject = "ETL Failure Alert: insert_backdated_snapshots"
@@ -296,19 +458,16 @@ def etl_once():
             print("⚠️ No cities in dim_location; aborting ETL.")
             return
 
+        loc_dicts = df_locs.to_dict("records")
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as ex:
+            futures = [ex.submit(fetch_one_record, loc) for loc in loc_dicts]
+
         rows = []
-        for row in df_locs.itertuples(index=False):
-            loc_dict = {
-                "location_id": row.location_id,
-                "lat":          row.lat,
-                "lon":          row.lon
-            }
+        for loc, future in zip(loc_dicts, futures):
             try:
-                flat = fetch_one_record(loc_dict)
-                rows.append(flat)
-                time.sleep(1)  # throttle API calls
+                rows.append(future.result())
             except Exception as fetch_err:
-                print(f"❌ Fetch error for location_id={row.location_id}: {fetch_err}")
+                print(f"❌ Fetch error for location_id={loc['location_id']}: {fetch_err}")
 
         if not rows:
             print("⚠️ No data fetched; skipping insert.")
@@ -317,16 +476,10 @@ def etl_once():
         df = pd.DataFrame(rows)
         df["obs_ts"] = pd.to_datetime(df["obs_ts"], unit="s", utc=True)
 
-        df_to_insert = df[[
-            "location_id", "obs_ts", "temp_c", "feels_like_c",
-            "humidity_pct", "pressure_hpa", "wind_speed_ms",
-            "weather_main", "weather_desc", "clouds_pct"
-        ]]
-
-        with engine.begin() as conn:
-            df_to_insert.to_sql("fact_weather", conn, if_exists="append", index=False)
+        n_rows = insert_fact_rows(df)
+        invalidate_dashboard_cache()
 
-        print(f"✅ Loaded {len(df_to_insert)} row(s) at {datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC")
+        print(f"✅ Loaded {n_rows} row(s) at {datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC")
     except Exception as e:
         subject = "ETL Failure Alert: etl_once"
         body = f"An exception occurred during ETL:\n\n{e}"